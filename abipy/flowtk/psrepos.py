@@ -35,7 +35,7 @@ import shutil
 import hashlib
 import requests
 
-from typing import Optional
+from typing import Optional, Iterator
 from urllib.parse import urlsplit
 from monty.termcolor import cprint, colored
 from pymatgen.io.abinit.pseudos import Pseudo, PseudoTable
@@ -68,9 +68,7 @@ def get_repos_root() -> str:
     """
     Return the path to the installation directory. Create directory if needed.
     """
-    if not os.path.exists(REPOS_ROOT):
-        os.mkdir(REPOS_ROOT)
-
+    os.makedirs(REPOS_ROOT, exist_ok=True)
     return REPOS_ROOT
 
 
@@ -90,7 +88,8 @@ def decode_pseudopath(filepath: str) -> str:
 
 
 def download_repo_from_url(url: str, save_dirpath: str,
-                           chunk_size: int = 2 * 1024**2, verbose: int = 0) -> None:
+                           chunk_size: int = 2 * 1024**2, verbose: int = 0,
+                           desc: Optional[str] = None, position: Optional[int] = None, file=None) -> None:
     """
     Dowload file from url.
 
@@ -99,6 +98,9 @@ def download_repo_from_url(url: str, save_dirpath: str,
         save_dirpath: The directory in which the tarball is unpacked.
         chunk_size: Chunk size used for downloading the file.
         verbose: Verbosity level
+        desc: Prefix for the progress bar.
+        position: Line offset of the progress bar. Useful to manage multiple bars at once.
+        file: File where messages are written (default: sys.stdout).
     """
     path = urlsplit(url).path
     filename = posixpath.basename(path)
@@ -110,10 +112,10 @@ def download_repo_from_url(url: str, save_dirpath: str,
         with tempfile.TemporaryDirectory(suffix=None, prefix=None, dir=None) as tmp_dir:
             tmp_filepath = os.path.join(tmp_dir, filename)
             if verbose:
-                print("Writing temporary file:", tmp_filepath)
+                print("Writing temporary file:", tmp_filepath, file=file)
 
             total_size_in_bytes = int(r.headers.get('content-length', 0))
-            progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True)
+            progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, desc=desc, position=position)
 
             with open(tmp_filepath, 'wb') as fd:
                 for chunk in r.iter_content(chunk_size=chunk_size):
@@ -126,15 +128,15 @@ def download_repo_from_url(url: str, save_dirpath: str,
 
             shutil.unpack_archive(tmp_filepath, extract_dir=tmp_dir)
 
-            dirpaths = [os.path.join(tmp_dir, basen) for basen in os.listdir(tmp_dir) if basen != filename]
+            # Single pass with scandir: entry.path and entry.is_dir() don't require extra syscalls.
+            with os.scandir(tmp_dir) as it:
+                entries = [entry for entry in it if entry.name != filename]
 
-            if len(dirpaths) != 1:
-                raise RuntimeError(f"Expecting single directory, got {dirpaths}")
-            if not os.path.isdir(dirpaths[0]):
-                raise RuntimeError(f"Expecting single directory, got {dirpaths}")
+            if len(entries) != 1 or not entries[0].is_dir():
+                raise RuntimeError(f"Expecting single directory, got {[entry.path for entry in entries]}")
 
-            if verbose: print(f"Moving {dirpaths[0]} to {save_dirpath}")
-            shutil.move(dirpaths[0], save_dirpath)
+            if verbose: print(f"Moving {entries[0].path} to {save_dirpath}", file=file)
+            shutil.move(entries[0].path, save_dirpath)
 
 
 def md5_for_filepath(filepath: str) -> str:
@@ -147,6 +149,19 @@ def md5_for_filepath(filepath: str) -> str:
         return m.hexdigest()
 
 
+def md5_for_binary_filepath(filepath: str) -> str:
+    """
+    Compute and return the md5 of the raw bytes of a file.
+    """
+    with open(filepath, "rb") as fh:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(fh, "md5").hexdigest()
+        m = hashlib.md5()
+        for chunk in iter(lambda: fh.read(1024**2), b""):
+            m.update(chunk)
+        return m.hexdigest()
+
+
 def get_repo_from_name(repo_name: str) -> PseudosRepo:
     """
     Return a PseudosRepo from its name ``repo_name``.
@@ -160,15 +175,46 @@ def get_repo_from_name(repo_name: str) -> PseudosRepo:
         raise KeyError(f"Couldn't find {repo_name} in the list of registered repos:\n{all_names}")
 
 
+def _list_repo_dirs(dirpath: str) -> list[str]:
+    """
+    Return the names of the registered repos that are installed as subdirectories of dirpath.
+    Names are given in the same order as _ALL_REPOS.
+    """
+    all_names = {repo.name for repo in _ALL_REPOS}
+    found = set()
+    # scandir gives us the entry type from the directory listing so we don't stat each entry.
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            if entry.name in all_names and entry.is_dir():
+                found.add(entry.name)
+                if len(found) == len(all_names): break
+
+    # Return the names in the order used to register the repos so that callers don't need to sort.
+    return [repo.name for repo in _ALL_REPOS if repo.name in found]
+
+
+def get_installed_repo_names(dirpath: Optional[str] = None) -> set[str]:
+    """
+    Return set with the names of the registered repos installed in dirpath (default: REPOS_ROOT).
+    This function performs a single scan of the directory hence it's faster than
+    calling `is_installed` for each repo. Note that dirpath is not created if it does not exist.
+    """
+    dirpath = REPOS_ROOT if not dirpath else dirpath
+    try:
+        return set(_list_repo_dirs(dirpath))
+    except FileNotFoundError:
+        # Nothing has been installed yet.
+        return set()
+
+
 def get_installed_repos_and_root(dirpath: Optional[str] = None) -> tuple[list[PseudosRepo], str]:
     """
-    Return (all_repos, dirpath)
+    Return (installed_repos, dirpath). Repos are given in the same order as get_all_registered_repos.
     """
     dirpath = REPOS_ROOT if not dirpath else dirpath
-    if not os.path.exists(dirpath): os.makedirs(dirpath)
-    dir_basenames = [name for name in os.listdir(dirpath) if os.path.isdir(os.path.join(dirpath, name))]
+    os.makedirs(dirpath, exist_ok=True)
     dirname2repo = {repo.name: repo for repo in _ALL_REPOS}
-    return [dirname2repo[dirname] for dirname in dir_basenames if dirname in dirname2repo], dirpath
+    return [dirname2repo[dirname] for dirname in _list_repo_dirs(dirpath)], dirpath
 
 
 class Citation:
@@ -217,10 +263,18 @@ class PseudosRepo(abc.ABC):
         self.relativity_type = relativity_type
         self.url = url
 
-    def to_rowdict(self, verbose: int = 0) -> dict:
+    def to_rowdict(self, verbose: int = 0, installed_names: Optional[set[str]] = None,
+                   exclude: Optional[list[str]] = None) -> dict:
         """
         Return dict with metadata, useful to build DataFrames.
+
+        Args:
+            verbose: Verbosity level.
+            installed_names: Set with the names of the installed repos as returned by get_installed_repo_names.
+                If None, the filesystem is checked.
+            exclude: List of keys to exclude.
         """
+        exclude = set(exclude) if exclude else set()
         row = dict(
             ps_generator=self.ps_generator,
             ps_type=self.ps_type,
@@ -228,14 +282,17 @@ class PseudosRepo(abc.ABC):
             relativity_type=self.relativity_type,
             project_name=self.project_name,
             version=self.version,
-            installed=self.is_installed(),
-            name=self.name,
         )
 
+        # Don't touch the filesystem if this entry is not needed.
+        if "installed" not in exclude:
+            row["installed"] = self.is_installed() if installed_names is None else self.name in installed_names
+
+        row["name"] = self.name
         if verbose:
             row.update(url=self.url)
 
-        return row
+        return {k: v for k, v in row.items() if k not in exclude}
 
     def __repr__(self) -> str:
         return self.name
@@ -275,27 +332,37 @@ class PseudosRepo(abc.ABC):
 
     def is_installed(self) -> bool:
         """True if the repo is already installed in REPOS_ROOT."""
-        return os.path.exists(os.path.join(REPOS_ROOT, self.name))
+        # Same check as get_installed_repo_names: a file with the same name is not an installed repo.
+        return os.path.isdir(os.path.join(REPOS_ROOT, self.name))
 
-    def install(self, verbose: int = 0) -> None:
+    def install(self, verbose: int = 0, position: Optional[int] = None, file=None) -> None:
         """
         Install the repository in the standard location relative to the `REPOS_ROOT` directory.
+
+        Args:
+            verbose: Verbosity level.
+            position: Line offset of the progress bar. Useful when several repos are installed at once.
+            file: File where messages are written (default: sys.stdout).
         """
-        print(f"Downloading repository from: {self.url} ...")
-        print(f"Installing {repr(self)} in: {self.dirpath}")
+        print(f"Downloading repository from: {self.url} ...", file=file)
+        print(f"Installing {repr(self)} in: {self.dirpath}", file=file)
         start = time.time()
-        if not os.path.exists(REPOS_ROOT): os.mkdir(REPOS_ROOT)
-        download_repo_from_url(self.url, self.dirpath, verbose=verbose)
-        self.validate_checksums(verbose)
-        print(f"Installation completed successfully in {time.time() - start:.2f} [s]")
+        get_repos_root()
+        download_repo_from_url(self.url, self.dirpath, verbose=verbose,
+                               desc=self.name, position=position, file=file)
+        self.validate_checksums(verbose, file=file)
+        print(f"Installation completed successfully in {time.time() - start:.2f} [s]", file=file)
 
     #####################
     # Abstract interface.
     #####################
 
     @abc.abstractmethod
-    def validate_checksums(self, verbose: int) -> None:
-        """Validate md5 checksums after download."""
+    def validate_checksums(self, verbose: int, file=None) -> None:
+        """
+        Validate md5 checksums after download.
+        Messages are written to file (default: sys.stdout).
+        """
 
     @property
     @abc.abstractmethod
@@ -317,6 +384,13 @@ class PseudosRepo(abc.ABC):
         Build and return the PseudoTable associated to the given table_name
         """
 
+    @abc.abstractmethod
+    def iter_pseudos(self, table_name: str, symbol: Optional[str] = None) -> Iterator[Pseudo]:
+        """
+        Generator yielding the pseudos associated to the given table_name one by one.
+        If symbol is not None, only pseudos for this element are parsed and returned.
+        """
+
 
 class OncvpspRepo(PseudosRepo):
     """
@@ -359,11 +433,12 @@ class OncvpspRepo(PseudosRepo):
                 doi="https://doi.org/10.1016/j.cpc.2018.01.012"),
         ]
 
-    def validate_checksums(self, verbose: int) -> None:
+    def validate_checksums(self, verbose: int, file=None) -> None:
         """
         Compare checksums given in the djson file with the ones computed from file after the donwload.
+        Messages are written to file (default: sys.stdout).
         """
-        print(f"\nValidating md5 checksums of {repr(self)}...")
+        print(f"\nValidating md5 checksums of {repr(self)}...", file=file)
         djson_paths = [os.path.join(self.dirpath, jfile) for jfile in ("standard.djson", "stringent.djson")]
 
         seen = set()
@@ -378,20 +453,24 @@ class OncvpspRepo(PseudosRepo):
                 seen.add(bname)
                 ref_md5 = d["md5"]
                 this_path = os.path.join(self.dirpath, symbol, bname)
-                this_md5 = md5_for_filepath(this_path)
+                this_md5 = md5_for_binary_filepath(this_path)
+                if ref_md5 != this_md5:
+                    # Reference checksums are computed from the decoded text and newlines are translated
+                    # in text mode so files with carriage returns are hashed again before failing.
+                    this_md5 = md5_for_filepath(this_path)
                 if ref_md5 != this_md5:
                     errors.append(f"Different md5 checksums for {this_path}")
                 else:
                     if verbose:
-                        print(f"MD5 checksum for {this_path} is OK")
+                        print(f"MD5 checksum for {this_path} is OK", file=file)
 
         if errors:
-            cprint("Checksum test: FAILED", color="red")
+            cprint(f"Checksum test for {self.name}: FAILED", color="red", file=file)
             errstr = "\n".join(errors)
             raise ValueError(f"Checksum test failed for the following pseudos:\n{errstr}\n"
                              f"Data is corrupted. Try to download {repr(self)} again")
         else:
-            cprint("Checksum test: OK", color="green")
+            cprint(f"Checksum test for {self.name}: OK", color="green", file=file)
 
     @memoized_method()
     def get_pseudos(self, table_name: str) -> PseudoTable:
@@ -399,26 +478,32 @@ class OncvpspRepo(PseudosRepo):
         Build and return the PseudoTable associated to the given table_name.
         Note that we use a per-instance cache to store the results.
         """
+        return PseudoTable(list(self.iter_pseudos(table_name)))
+
+    def iter_pseudos(self, table_name: str, symbol: Optional[str] = None) -> Iterator[Pseudo]:
+        """
+        Generator yielding the pseudos associated to the given table_name.
+        If symbol is not None, only pseudos for this element are parsed and returned.
+        """
         djson_path = os.path.join(self.dirpath, f"{table_name}.djson")
-        pseudos = []
         with open(djson_path, "rt") as fh:
             djson = json.load(fh)
-            for symbol, d in djson["pseudos_metadata"].items():
-                bname = d["basename"]
-                pseudo_path = os.path.join(self.dirpath, symbol, bname)
-                #print(f"Reading pseudo from {pseudo_path}")
-                # FIXME: Bug if ~ in pseudo_path
-                pseudo_path = os.path.expanduser(pseudo_path)
-                pseudo = Pseudo.from_file(pseudo_path)
-                # Attach a fake dojo_report
-                # TODO: This part should be rationalized/rewritten
-                hints = d["hints"]
-                dojo_report = {"hints": hints}
-                pseudo.dojo_report = dojo_report
-                #print(f"pseudo.filepath after {pseudo.filepath}")
-                pseudos.append(pseudo)
-
-        return PseudoTable(pseudos)
+
+        for pseudo_symbol, d in djson["pseudos_metadata"].items():
+            if symbol is not None and pseudo_symbol != symbol: continue
+            bname = d["basename"]
+            pseudo_path = os.path.join(self.dirpath, pseudo_symbol, bname)
+            #print(f"Reading pseudo from {pseudo_path}")
+            # FIXME: Bug if ~ in pseudo_path
+            pseudo_path = os.path.expanduser(pseudo_path)
+            pseudo = Pseudo.from_file(pseudo_path)
+            # Attach a fake dojo_report
+            # TODO: This part should be rationalized/rewritten
+            hints = d["hints"]
+            dojo_report = {"hints": hints}
+            pseudo.dojo_report = dojo_report
+            #print(f"pseudo.filepath after {pseudo.filepath}")
+            yield pseudo
 
 
 class JthRepo(PseudosRepo):
@@ -444,15 +529,22 @@ class JthRepo(PseudosRepo):
         # ATOMPAW-LDA-JTHv0.4
         return f"{self.ps_generator}-{self.xc_name}-{self.project_name}v{self.version}"
 
-    def validate_checksums(self, verbose: int) -> None:
-        print(f"\nValidating md5 checksums of {repr(self)} ...")
-        cprint("WARNING: JTH-PAW repository does not support md5 checksums!!!", color="red")
+    def validate_checksums(self, verbose: int, file=None) -> None:
+        print(f"\nValidating md5 checksums of {repr(self)} ...", file=file)
+        cprint("WARNING: JTH-PAW repository does not support md5 checksums!!!", color="red", file=file)
 
     @memoized_method()
     def get_pseudos(self, table_name: str) -> PseudoTable:
         """
         Build and return the PseudoPotential table associated to the given table_name
         """
+        return PseudoTable(list(self.iter_pseudos(table_name)))
+
+    def iter_pseudos(self, table_name: str, symbol: Optional[str] = None) -> Iterator[Pseudo]:
+        """
+        Generator yielding the pseudos associated to the given table_name.
+        If symbol is not None, only pseudos for this element are returned.
+        """
         if table_name != "standard":
             raise ValueError(f"JTH table does not support {table_name=}")
 
@@ -462,13 +554,11 @@ class JthRepo(PseudosRepo):
             relpaths = fh.readlines()
             relpaths = [l for l in relpaths if l.strip()]
 
-        pseudos = []
         for rpath in relpaths:
             pseudo = Pseudo.from_file(os.path.join(self.dirpath, rpath))
             # TODO: Get hints
-            pseudos.append(pseudo)
-
-        return PseudoTable(pseudos)
+            if symbol is not None and pseudo.symbol != symbol: continue
+            yield pseudo
 
     def get_citations(self) -> list[Citation]:
         return [
@@ -509,11 +599,12 @@ def tabulate_repos(repos: list[PseudosRepo], exclude: Optional[list[str]] = None
     """
     bool2color = {True: "green", False: "red"}
 
+    # Scan the installation directory once instead of calling is_installed for each repo.
+    installed_names = None if exclude and "installed" in exclude else get_installed_repo_names()
+
     rows = []
     for i, repo in enumerate(repos):
-        d = repo.to_rowdict(verbose=verbose)
-        if exclude:
-            d = {k: d[k] for k in d if k not in exclude}
+        d = repo.to_rowdict(verbose=verbose, installed_names=installed_names, exclude=exclude)
 
         if i == 0:
             headers = list(d.keys())
@@ -545,8 +636,11 @@ def tabulate_repos(repos: list[PseudosRepo], exclude: Optional[list[str]] = None
 # Here we register the repositories and build _ALL_REPOS list
 #############################################################
 
-def get_all_registered_repos():
-    return _ALL_REPOS[:]
+def get_all_registered_repos() -> list[PseudosRepo]:
+    """
+    Return list with all the registered repos. NC repos come first.
+    """
+    return list(_ALL_REPOS)
 
 
 _mk_onc = OncvpspRepo.from_github
@@ -567,7 +661,8 @@ _PAW_REPOS = [
     _mk_jth(xc_name="PBE", relativity_type="SR", version="1.1"),
 ]
 
-_ALL_REPOS = _ONCVPSP_REPOS + _PAW_REPOS
+# Immutable so that the order used to register the repos is the same everywhere.
+_ALL_REPOS = tuple(_ONCVPSP_REPOS + _PAW_REPOS)
 
 # Make sure repo name is unique.
 _repo_names = [_repo.name for _repo in _ALL_REPOS]
@@ -4,10 +4,14 @@ Tests for psrepos.py module
 import tempfile
 import os
 
+from unittest import mock
+
 from abipy.core.testing import AbipyTest
+from abipy.flowtk import psrepos
 from abipy.flowtk.psrepos import (OncvpspRepo, get_repo_from_name, encode_pseudopath, decode_pseudopath,
                                   download_repo_from_url, tabulate_repos, get_all_registered_repos,
-                                  get_installed_repos_and_root)
+                                  get_installed_repos_and_root, get_installed_repo_names,
+                                  md5_for_filepath, md5_for_binary_filepath)
 
 
 class TestPsRepos(AbipyTest):
@@ -55,6 +59,8 @@ class TestPsRepos(AbipyTest):
         d = repo.to_rowdict(verbose=2)
         assert d["installed"] is False
         assert d["version"] == "0.1"
+        assert repo.to_rowdict(installed_names={repo.name})["installed"] is True
+        assert "installed" not in repo.to_rowdict(exclude=["installed"])
 
         # For the time being, we don't test the installation procedure.
         #repo.install()
@@ -80,6 +86,56 @@ class TestPsRepos(AbipyTest):
         installed_repos, root = get_installed_repos_and_root()
         assert os.path.exists(root)
 
+    def test_get_installed_repos_and_root(self):
+        """Testing get_installed_repos_and_root with custom directory."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # get_installed_repo_names should not create the directory.
+            missing_dir = os.path.join(tmp_dir, "missing")
+            assert get_installed_repo_names(missing_dir) == set()
+            assert not os.path.exists(missing_dir)
+
+            repos, root = get_installed_repos_and_root(tmp_dir)
+            assert not repos and root == tmp_dir
+
+            # Files and unregistered directories should be ignored.
+            open(os.path.join(tmp_dir, "ONCVPSP-PBE-SR-PDv0.4"), "wt").close()
+            os.mkdir(os.path.join(tmp_dir, "foobar"))
+            repos, _ = get_installed_repos_and_root(tmp_dir)
+            assert not repos
+            with mock.patch.object(psrepos, "REPOS_ROOT", tmp_dir):
+                repo = get_repo_from_name("ONCVPSP-PBE-SR-PDv0.4")
+                assert not repo.is_installed()
+                assert repo.to_rowdict()["installed"] is False
+                assert repo.name not in get_installed_repo_names()
+
+            # New directories should be detected.
+            os.mkdir(os.path.join(tmp_dir, "ONCVPSP-PBEsol-SR-PDv0.4"))
+            repos, _ = get_installed_repos_and_root(tmp_dir)
+            assert [repo.name for repo in repos] == ["ONCVPSP-PBEsol-SR-PDv0.4"]
+            assert get_installed_repo_names(tmp_dir) == {"ONCVPSP-PBEsol-SR-PDv0.4"}
+
+            for i in range(5):
+                os.mkdir(os.path.join(tmp_dir, f"dir{i}"))
+            os.mkdir(os.path.join(tmp_dir, "ONCVPSP-LDA-SR-PDv0.4"))
+            assert get_installed_repo_names(tmp_dir) == {"ONCVPSP-PBEsol-SR-PDv0.4", "ONCVPSP-LDA-SR-PDv0.4"}
+            # Repos should be returned in the order used to register them.
+            repos, _ = get_installed_repos_and_root(tmp_dir)
+            assert [repo.name for repo in repos] == ["ONCVPSP-PBEsol-SR-PDv0.4", "ONCVPSP-LDA-SR-PDv0.4"]
+
+    def test_md5(self):
+        """Testing md5 checksums."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "unix.txt")
+            with open(path, "wb") as fh:
+                fh.write(b"line1\nline2\n")
+            assert md5_for_binary_filepath(path) == md5_for_filepath(path)
+
+            # Text mode converts carriage returns hence the two checksums differ.
+            path = os.path.join(tmp_dir, "dos.txt")
+            with open(path, "wb") as fh:
+                fh.write(b"line1\r\nline2\r\n")
+            assert md5_for_binary_filepath(path) != md5_for_filepath(path)
+
     def test_oncvpsp_api(self):
         """Testing ONCVPSP API."""
         repo_sr = get_repo_from_name("ONCVPSP-PBEsol-SR-PDv0.4")
@@ -109,6 +165,8 @@ class TestPsRepos(AbipyTest):
                 assert pseudos.allnc
                 assert all(p.has_hints for p in pseudos)
                 assert all(not p.supports_soc for p in pseudos)
+                # Test generator API.
+                assert [p.symbol for p in repo_sr.iter_pseudos(table_name, symbol="Si")] == ["Si"]
 
         if repo_fr.is_installed():
             repo_fr.validate_checksums(verbose=1)
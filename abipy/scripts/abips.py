@@ -7,21 +7,36 @@ from __future__ import annotations
 import sys
 #import os
 import argparse
+from io import StringIO
+from queue import SimpleQueue
+from concurrent.futures import ThreadPoolExecutor
 import abipy.tools.cli_parsers as cli
 
 from monty.termcolor import cprint
-from pymatgen.core.periodic_table import Element
 from abipy.core.release import __version__
 from abipy.tools import duck
-from abipy.flowtk.pseudos import PseudoTable
-from abipy.flowtk.psrepos import (tabulate_repos, repos_from_names,
-                                  get_all_registered_repos, get_installed_repos_and_root)
+
+
+def _call_buffered(func, *args, **kwargs) -> tuple:
+    """
+    Call func(*args, file=stream, **kwargs) where stream is a StringIO.
+    Return (output, exc) where output is the text written to stream
+    and exc is the exception raised by func or None.
+    Used to print the output of the tasks executed by a pool of threads without interleaving.
+    """
+    stream = StringIO()
+    try:
+        func(*args, file=stream, **kwargs)
+    except Exception as exc:
+        return stream.getvalue(), exc
+    return stream.getvalue(), None
 
 
 def abips_list(options) -> list:
     """
     List installed pseudopotential repos.
     """
+    from abipy.flowtk.psrepos import tabulate_repos, get_installed_repos_and_root
     repos, repos_root = get_installed_repos_and_root()
     if not repos:
         print("Could not find any pseudopotential repository installed in:", repos_root)
@@ -34,12 +49,17 @@ def abips_list(options) -> list:
         print("\nUse -c to validate the md5 checksum")
         return 0
 
+    # Repos are independent so we can use a pool of threads. Only hashing the binary files
+    # releases the GIL, parsing the djson files and the text-mode fallback do not.
+    # The output of each repo is buffered and printed in submission order to avoid interleaving.
     exc_list = []
-    for repo in repos:
-        try:
-            repo.validate_checksums(options.verbose)
-        except Exception as exc:
-            exc_list.append(exc)
+    with ThreadPoolExecutor() as executor:
+        futures = [executor.submit(_call_buffered, repo.validate_checksums, options.verbose) for repo in repos]
+        for future in futures:
+            output, exc = future.result()
+            sys.stdout.write(output)
+            if exc is not None:
+                exc_list.append(exc)
 
     if exc_list:
         print("\nList of exceptions raised by validate_checksums:")
@@ -53,6 +73,7 @@ def abips_avail(options) -> int:
     """
     Show available pseudopotential repos.
     """
+    from abipy.flowtk.psrepos import tabulate_repos, get_all_registered_repos
     print("List of available pseudopotential repositories:\n")
     all_repos = get_all_registered_repos()
     print(tabulate_repos(all_repos, with_citations=True, verbose=options.verbose))
@@ -108,51 +129,114 @@ def abips_avail(options) -> int:
 #    return 0
 
 
+def _install_many(repos: list, verbose: int, max_workers: int = 4) -> list:
+    """
+    Install a list of repositories using a pool of threads to overlap the downloads.
+    Return list with the exception raised by install for each repo (None if success).
+    """
+    from tqdm import tqdm
+    max_workers = max(1, max_workers)
+
+    # Each running install gets a free line for its progress bar so that we use at most max_workers lines.
+    positions = SimpleQueue()
+    for i in range(max_workers):
+        positions.put(i)
+
+    def _install(repo):
+        position = positions.get()
+        # The messages written by install are buffered and printed by the main thread once the repo is done.
+        tqdm.write(f"Starting installation of {repo.name} ...", file=sys.stdout)
+        try:
+            return _call_buffered(repo.install, verbose=verbose, position=position)
+        finally:
+            positions.put(position)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for output, exc in executor.map(_install, repos):
+            # tqdm.write does not break the progress bars that are still active.
+            tqdm.write(output, file=sys.stdout, end="")
+            results.append(exc)
+
+    return results
+
+
 def abips_install(options) -> int:
     """
     Install pseudopotential repositories by name(s).
     Use `avail` command to get repo names.
     """
-    repos = repos_from_names(options.repo_names)
-    repos = [repo for repo in repos if not repo.is_installed()]
+    from abipy.flowtk.psrepos import tabulate_repos, repos_from_names, get_installed_repo_names, get_repos_root
+    wanted = repos_from_names(options.repo_names)
+    installed = get_installed_repo_names()
+    repos = [repo for repo in wanted if repo.name not in installed]
 
     if not repos:
         print("Table(s) are already installed! Nothing to do. Returning")
         return 0
 
+    skipped = [repo.name for repo in wanted if repo.name in installed]
+    if skipped:
+        print("Already installed:", ", ".join(skipped))
+
     print("The following pseudopotential repositories will be installed:")
     print(tabulate_repos(repos, verbose=options.verbose), "\n")
     #if not options.yes and cli.user_wants_to_abort(): return 2
 
-    for repo in repos:
-        repo.install(verbose=options.verbose)
+    results = _install_many(repos, options.verbose, max_workers=options.jobs)
+    exc_list = [exc for exc in results if exc is not None]
+    new_repos = [repo for repo, exc in zip(repos, results) if exc is None]
 
-    if options.verbose:
+    # We already know what has been installed so there's no need to scan the directory again.
+    if options.verbose > 1:
         abips_list(options)
+    else:
+        print(f"\nInstalled {len(new_repos)} repositories in {get_repos_root()}:")
+        for repo in new_repos:
+            print(f"\t{repo.name}")
 
-    return 0
+    if exc_list:
+        print("\nList of exceptions raised by install:")
+        for exc in exc_list:
+            print(exc)
+
+    return len(exc_list)
 
 
 def abips_show(options) -> int:
     """
     Show info on pseudopotential table(s).
     """
-    repos = repos_from_names(options.repo_names)
-    repos = [repo for repo in repos if repo.is_installed()]
+    from abipy.flowtk.pseudos import PseudoTable
+    from abipy.flowtk.psrepos import repos_from_names, get_installed_repo_names
+    wanted = repos_from_names(options.repo_names)
+    installed = get_installed_repo_names()
+    repos = [repo for repo in wanted if repo.name in installed]
 
     if not repos:
         print(f"There's no installed repository with name in: {options.repo_names}")
         return 1
 
+    skipped = [repo.name for repo in wanted if repo.name not in installed]
+    if skipped:
+        print("Not installed:", ", ".join(skipped))
+
     for repo in repos:
-        print(repo)
+        # Collect the output and write it once per repo instead of calling print many times.
+        lines = [str(repo)]
         for table_name in repo.table_names:
-            pseudos = repo.get_pseudos(table_name=table_name)
-            print(f"For table_name: {table_name}:\n")
+            lines.append(f"For table_name: {table_name}:\n")
             if options.symbol is not None:
-                print("Selecting pseudos with symbol:", options.symbol)
+                lines.append(f"Selecting pseudos with symbol: {options.symbol}")
+                # Parse only the pseudos for this element instead of building the full table.
+                pseudos = PseudoTable(list(repo.iter_pseudos(table_name, symbol=options.symbol)))
                 pseudos = pseudos.pseudo_with_symbol(options.symbol, allow_multi=False)
-            print(pseudos)
+            else:
+                pseudos = repo.get_pseudos(table_name=table_name)
+            lines.append(str(pseudos))
+
+        lines.append("")
+        sys.stdout.write("\n".join(lines))
 
     return 0
 
@@ -161,6 +245,9 @@ def abips_element(options) -> int:
     """
     Find all pseudos in the installed tables for the given element (symbol or znucl).
     """
+    from pymatgen.core.periodic_table import Element
+    from abipy.flowtk.pseudos import PseudoTable
+    from abipy.flowtk.psrepos import get_installed_repos_and_root
     # Accept symbol string or Z
     symbol = options.element
     if symbol.isnumeric():
@@ -175,7 +262,7 @@ def abips_element(options) -> int:
     for repo in repos:
         for table_name in repo.table_names:
             try:
-                pseudos = repo.get_pseudos(table_name=table_name)
+                pseudos = PseudoTable(list(repo.iter_pseudos(table_name, symbol=symbol)))
                 pseudo = pseudos.pseudo_with_symbol(symbol, allow_multi=False)
             except Exception as exc:
                 cprint(f"{str(exc)}", "red")
@@ -228,6 +315,17 @@ def abips_mkff(options) -> int:
     return 0
 
 
+# Map sub-command name to the function implementing it.
+DISPATCH = {
+    "avail": abips_avail,
+    "list": abips_list,
+    "install": abips_install,
+    "show": abips_show,
+    "element": abips_element,
+    "mkff": abips_mkff,
+}
+
+
 def get_epilog() -> str:
     return """\
 
@@ -245,7 +343,7 @@ Usage example:
   #abips.py jth_install                        --> Get all JTH PAW repositories (most recent version)
 
 
-def get_parser(with_epilog=False):
+def get_parser(with_epilog=False, command=None):
 
     # Parent parser for common options.
     copts_parser = argparse.ArgumentParser(add_help=False)
@@ -270,19 +368,30 @@ def get_parser(with_epilog=False):
     # Create the parsers for the sub-commands
     subparsers = parser.add_subparsers(dest='command', help='sub-command help', description="Valid subcommands")
 
+    # Build only the subparser required by command (if known) to reduce the startup time.
+    # All the subparsers are built if command is None so that the help message is complete.
+    if command not in DISPATCH: command = None
+    def wants(name):
+        return command is None or command == name
+
     # Subparser for avail command.
-    subparsers.add_parser("avail", parents=[copts_parser], help=abips_avail.__doc__)
+    if wants("avail"):
+        subparsers.add_parser("avail", parents=[copts_parser], help=abips_avail.__doc__)
 
     # Subparser for list command.
-    p_list = subparsers.add_parser("list", parents=[copts_parser], help=abips_list.__doc__)
-    p_list.add_argument("-c", "--checksums", action="store_true", default=False,
-                        help="Validate md5 checksums.")
+    if wants("list"):
+        p_list = subparsers.add_parser("list", parents=[copts_parser], help=abips_list.__doc__)
+        p_list.add_argument("-c", "--checksums", action="store_true", default=False,
+                            help="Validate md5 checksums.")
 
     # Subparser for install command.
-    p_install = subparsers.add_parser("install", parents=[copts_parser], help=abips_install.__doc__)
-    p_install.add_argument("repo_names", type=str, nargs="+", help="List of repositories to download.")
-    p_install.add_argument("-c", "--checksums", action="store_true", default=False,
-                           help="Validate md5 checksums.")
+    if wants("install"):
+        p_install = subparsers.add_parser("install", parents=[copts_parser], help=abips_install.__doc__)
+        p_install.add_argument("repo_names", type=str, nargs="+", help="List of repositories to download.")
+        p_install.add_argument("-c", "--checksums", action="store_true", default=False,
+                               help="Validate md5 checksums.")
+        p_install.add_argument("-j", "--jobs", type=int, default=4,
+                               help="Number of repositories downloaded in parallel. Default: 4")
 
     # Subparser for onc_install command.
     #p_onc_install = subparsers.add_parser("onc_install", parents=[copts_parser], help=abips_onc_install.__doc__)
@@ -293,21 +402,24 @@ def get_parser(with_epilog=False):
     #p_jth_install.add_argument("-v", type=str, default=None, help="Table version. Default: latest one ")
 
     # Subparser for show command.
-    p_show = subparsers.add_parser("show", parents=[copts_parser], help=abips_show.__doc__)
-    p_show.add_argument("repo_names", type=str, nargs="+", help="List of repo names.")
-    p_show.add_argument("-s", "--symbol", type=str, default=None, help="Select pseudo by element symbol.")
+    if wants("show"):
+        p_show = subparsers.add_parser("show", parents=[copts_parser], help=abips_show.__doc__)
+        p_show.add_argument("repo_names", type=str, nargs="+", help="List of repo names.")
+        p_show.add_argument("-s", "--symbol", type=str, default=None, help="Select pseudo by element symbol.")
 
     # Subparser for list command.
-    p_element = subparsers.add_parser("element", parents=[copts_parser], help=abips_element.__doc__)
-    p_element.add_argument("element", type=str, help="Element symbol or atomic number.")
+    if wants("element"):
+        p_element = subparsers.add_parser("element", parents=[copts_parser], help=abips_element.__doc__)
+        p_element.add_argument("element", type=str, help="Element symbol or atomic number.")
 
     # Subparser for mkff command.
-    p_mkff = subparsers.add_parser("mkff", parents=[copts_parser], help=abips_mkff.__doc__)
-    p_mkff.add_argument("pseudo_paths", nargs="+", type=str, help="Pseudopotential path.")
-    p_mkff.add_argument("--ecut", type=float, required=True, help="Cutoff energy in Ha.")
-    p_mkff.add_argument("-rc", "--vloc-rcut-list", nargs="+", default=None, type=float,
-                        help="List of cutoff radii for vloc in Bohr.")
-    cli.add_expose_options_to_parser(p_mkff)
+    if wants("mkff"):
+        p_mkff = subparsers.add_parser("mkff", parents=[copts_parser], help=abips_mkff.__doc__)
+        p_mkff.add_argument("pseudo_paths", nargs="+", type=str, help="Pseudopotential path.")
+        p_mkff.add_argument("--ecut", type=float, required=True, help="Cutoff energy in Ha.")
+        p_mkff.add_argument("-rc", "--vloc-rcut-list", nargs="+", default=None, type=float,
+                            help="List of cutoff radii for vloc in Bohr.")
+        cli.add_expose_options_to_parser(p_mkff)
 
     return parser
 
@@ -320,7 +432,9 @@ def main():
         if err_msg: sys.stderr.write("Fatal Error\n" + err_msg + "\n")
         sys.exit(error_code)
 
-    parser = get_parser(with_epilog=True)
+    # Pass the sub-command so that get_parser builds only the subparser we need.
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    parser = get_parser(with_epilog=True, command=command)
 
     # Parse command line.
     try:
@@ -337,7 +451,11 @@ def main():
         sns.set(context=options.seaborn, style='darkgrid', palette='deep',
                 font='sans-serif', font_scale=1, color_codes=False, rc=None)
 
-    return globals()[f"abips_{options.command}"](options)
+    func = DISPATCH.get(options.command)
+    if func is None:
+        show_examples_and_exit(error_code=1)
+
+    return func(options)
 
 
 if __name__ == "__main__":
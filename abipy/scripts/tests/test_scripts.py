@@ -518,6 +518,30 @@ class TestAbipsp(ScriptTest):
         r = env.run(self.script, "list", self.loglevel, self.verbose, expect_stderr=self.expect_stderr)
         # Cannot test other commands as they perform installation
 
+    def test_install_many(self):
+        """Testing _install_many with stub repos."""
+        from abipy.scripts.abips import _install_many
+
+        class StubRepo:
+            def __init__(self, name, fail=False):
+                self.name, self.fail = name, fail
+                self.position = None
+
+            def install(self, verbose=0, position=None, file=None):
+                self.position = position
+                print(f"Installing {self.name}", file=file)
+                if self.fail:
+                    raise RuntimeError(f"Cannot install {self.name}")
+
+        repos = [StubRepo("repo0"), StubRepo("repo1", fail=True), StubRepo("repo2")]
+        results = _install_many(repos, verbose=0, max_workers=2)
+        # Results should be returned in the same order as the input repos.
+        assert len(results) == 3
+        assert results[0] is None and results[2] is None
+        assert isinstance(results[1], RuntimeError) and "repo1" in str(results[1])
+        # Progress bars should not use more lines than workers.
+        assert all(repo.position in (0, 1) for repo in repos)
+
 
 #class TestAbidb(ScriptTest):
 #    script = os.path.join(script_dir, "abidb.py")
@@ -5,12 +5,19 @@ from __future__ import annotations
 
 import argparse
 import os
+import sys
 
 from pprint import pformat
 
 
 def user_wants_to_abort() -> bool:
-    """Interactive prompt, return False if user entered `n` or `no`."""
+    """
+    Interactive prompt, return True if user entered `n` or `no`.
+    Return False without prompting if stdin is not a terminal e.g. scripts, CI or daemons.
+    """
+    if sys.stdin is None or not sys.stdin.isatty():
+        return False
+
     try:
         answer = input("\nDo you want to continue [Y/n]")
     except EOFError:
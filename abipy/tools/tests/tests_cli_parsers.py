@@ -1,5 +1,7 @@
 # coding: utf-8
 """Tests for cli_parsers module."""
+import io
+import sys
 import pytest
 
 from abipy.tools import cli_parsers as cli
@@ -15,3 +17,14 @@ class TestCliParsers(AbipyTest):
         assert cli.range_from_str("2:3:2") == range(2,3,2)
         with pytest.raises(ValueError):
             cli.range_from_str("2:3:2:3")
+
+    def test_user_wants_to_abort(self):
+        # Prompt is skipped if stdin is not a terminal or not available.
+        stdin = sys.stdin
+        try:
+            sys.stdin = io.StringIO("n\n")
+            assert not cli.user_wants_to_abort()
+            sys.stdin = None
+            assert not cli.user_wants_to_abort()
+        finally:
+            sys.stdin = stdin